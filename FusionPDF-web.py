@@ -1,109 +1,106 @@
 # FusionPDF-web.py — Natural Mocha v3.1 (with working resets)
 
+import multiprocessing
 import os
-import re
 import tempfile
-from io import BytesIO
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import zipfile
 
 import streamlit as st
-import PyPDF2
 import pandas as pd
-from pdf2image import convert_from_path
+
+from utils.fusion_core import (
+    compare_pdf_values,
+    merge_pdfs_bytes,
+    pdf_digest,
+    preview_pdf_first_page_as_image,
+    process_pair,
+)
 
 # -------------------------
-# Core Functions
+# Helpers
 # -------------------------
 
-def extract_value_from_pdf(pdf_file_path: str, keyword: str) -> float:
-    """Extract a numeric value from PDF based on a keyword."""
-    if not os.path.exists(pdf_file_path):
-        return -1
-    try:
-        with open(pdf_file_path, 'rb') as f:
-            reader = PyPDF2.PdfReader(f)
-            text = "".join((page.extract_text() or "") for page in reader.pages)
-        text = re.sub(r'[\u00A0\u202F]', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        if keyword.lower().strip() in ["vat", "v.a.t", "ppn"]:
-            pattern = r"(?i)v[\s\u00A0\u202F\.\-]*a[\s\u00A0\u202F\.\-]*t[\s\u00A0\u202F\.\-]*[\s:\-\(\)%]*([\d]+(?:[.,]\d{3})*(?:[.,]\d{2})?)"
-        else:
-            pattern = rf"(?i){re.escape(keyword)}[\s:\-\(\)%]*([\d]+(?:[.,]\d{{3}})*(?:[.,]\d{{2}})?)"
-        match = re.search(pattern, text)
-        if match:
-            raw = match.group(1)
-        elif keyword.lower().strip() in ["vat", "v.a.t", "ppn"]:
-            sub = re.search(r"(?:Sub\s*Total|Subtotal)[^\d]{0,10}([\d]+(?:[.,]\d{3})*(?:[.,]\d{2})?)", text, re.IGNORECASE)
-            if sub:
-                subtotal = float(sub.group(1).replace('.', '').replace(',', '.'))
-                return round(subtotal * 0.11, 2)
-            else:
-                return -1
-        else:
-            return -1
-        return float(raw.replace('.', '').replace(',', '.'))
-    except Exception:
-        return -1
-
-
-def compare_pdf_values(invoice_pdf: str, facture_pdf: str, keywords: dict) -> dict:
-    """Compare extracted values between invoice and facture."""
-    invoice_value1 = extract_value_from_pdf(invoice_pdf, keywords.get('invoice_k1', ''))
-    invoice_value2 = extract_value_from_pdf(invoice_pdf, keywords.get('invoice_k2', ''))
-    facture_value1 = extract_value_from_pdf(facture_pdf, keywords.get('facture_k1', ''))
-    facture_value2 = extract_value_from_pdf(facture_pdf, keywords.get('facture_k2', ''))
-
-    def almost_equal(a, b, tol=1.0):
-        return a != -1 and b != -1 and abs(a - b) <= tol
-
-    match = almost_equal(invoice_value1, facture_value1) and almost_equal(invoice_value2, facture_value2)
-    return {
-        'invoice_value1': invoice_value1,
-        'invoice_value2': invoice_value2,
-        'facture_value1': facture_value1,
-        'facture_value2': facture_value2,
-        'match': match,
+# Batches this small finish before a worker pool pays for itself, so they run in-process.
+INLINE_MAX_PAIRS = 8
+
+
+@st.cache_resource(show_spinner=False)
+def get_bulk_pool() -> ProcessPoolExecutor:
+    """Worker pool shared by all sessions, started once per server process."""
+    # Streamlit's server is multi-threaded, so forking it can hand a worker a lock held by
+    # another session (e.g. MuPDF's during a preview). Start workers from a clean process instead.
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    )
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+
+
+def iter_pair_results(pairs, pending, keywords, force_merge):
+    """Yield (index, process_pair result) for each pending (index, cached comparison) as it finishes."""
+    if len(pending) <= INLINE_MAX_PAIRS:
+        for i, comp in pending:
+            yield i, process_pair(*pairs[i], keywords, force_merge, comp)
+        return
+    # Pairs are independent and CPU-bound, so spread them over worker processes.
+    futures = {
+        get_bulk_pool().submit(process_pair, *pairs[i], keywords, force_merge, comp): i
+        for i, comp in pending
     }
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    except BrokenProcessPool:
+        # A dead worker breaks the pool for good; start a fresh one on the next run.
+        get_bulk_pool.clear()
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class BulkZip:
+    """On-disk ZIP of merged PDFs, deleted on discard() or once nothing references it.
+
+    It lives in the session state, so the file goes away with a session that is closed or
+    times out without ever pressing Reset.
+    """
 
+    def __init__(self, path: str):
+        self.path = path
+        self._finalizer = weakref.finalize(self, _remove_file, path)
 
-def merge_pdfs_bytes(pdf1_path: str, pdf2_path: str) -> bytes:
-    """Merge two PDFs and return as bytes."""
-    writer = PyPDF2.PdfWriter()
-    with open(pdf1_path, 'rb') as f1, open(pdf2_path, 'rb') as f2:
-        for p in PyPDF2.PdfReader(f1).pages:
-            writer.add_page(p)
-        for p in PyPDF2.PdfReader(f2).pages:
-            writer.add_page(p)
-    out = BytesIO()
-    writer.write(out)
-    out.seek(0)
-    return out.read()
-
-
-def preview_pdf_first_page_as_image(pdf_path: str, dpi: int = 100) -> BytesIO:
-    images = convert_from_path(pdf_path, dpi=dpi, first_page=1, last_page=1)
-    bio = BytesIO()
-    images[0].save(bio, format='PNG')
-    bio.seek(0)
-    return bio
-
-
-def save_uploaded_to_temp(uploaded_file):
-    if uploaded_file is None:
-        return ''
-    suffix = '.pdf'
-    tf = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tf.write(uploaded_file.getbuffer())
-    tf.flush()
-    tf.close()
-    return tf.name
+    def read(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def discard(self):
+        self._finalizer()
+
+
+def discard_bulk_zip():
+    """Forget the last bulk ZIP and delete its file on disk."""
+    bulk_zip = st.session_state.pop('bulk_zip', None)
+    if bulk_zip is not None:
+        bulk_zip.discard()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def cached_preview_png(pdf_bytes: bytes) -> bytes:
+    """First-page PNG for an upload; Streamlit keys the cache on the PDF content."""
+    return preview_pdf_first_page_as_image(pdf_bytes)
 
 # -------------------------
 # Streamlit Setup
 # -------------------------
 
-st.set_page_config(page_icon="📔", page_title="FusionPDF — Mocha", layout="wide")
-
 MOCHA_CSS = """
 <style>
 :root {
@@ -132,196 +129,243 @@ html, body, [class*="stApp"] {
 .small-muted { color: var(--muted); font-size: 13px; }
 </style>
 """
-st.markdown(MOCHA_CSS, unsafe_allow_html=True)
 
-# -------------------------
-# Sidebar navigation
-# -------------------------
 
-page = st.sidebar.radio("Navigation", ["Single Comparison", "Bulk Comparison"])
-st.sidebar.markdown("<hr>", unsafe_allow_html=True)
-force_merge = st.sidebar.checkbox("Force merge even if values don’t match", value=False)
+def main():
+    st.set_page_config(page_icon="📔", page_title="FusionPDF — Mocha", layout="wide")
+    st.markdown(MOCHA_CSS, unsafe_allow_html=True)
 
-st.sidebar.markdown("<div class='app-card'><div class='section-title'>Keywords</div>", unsafe_allow_html=True)
-invoice_k1 = st.sidebar.text_input('Invoice keyword 1', value='Sub Total')
-invoice_k2 = st.sidebar.text_input('Invoice keyword 2', value='VAT')
-facture_k1 = st.sidebar.text_input('Facture keyword 1', value='Harga Jual / Penggantian / Uang Muka / Termin')
-facture_k2 = st.sidebar.text_input('Facture keyword 2', value='Jumlah PPN (Pajak Pertambahan Nilai)')
-st.sidebar.markdown("</div>", unsafe_allow_html=True)
+    # -------------------------
+    # Sidebar navigation
+    # -------------------------
 
-# -------------------------
-# Single Comparison Page
-# -------------------------
+    page = st.sidebar.radio("Navigation", ["Single Comparison", "Bulk Comparison"])
+    st.sidebar.markdown("<hr>", unsafe_allow_html=True)
+    force_merge = st.sidebar.checkbox("Force merge even if values don’t match", value=False)
 
-if page == "Single Comparison":
-    st.title("FusionPDF — Single Comparison")
-
-    # Initialize key counter for resetting uploaders
-    if "upload_key_single" not in st.session_state:
-        st.session_state["upload_key_single"] = 0
-
-    col1, col2 = st.columns(2)
-    comparison_result = None
-
-    with col1:
-        st.markdown("<div class='app-card'><div class='section-title'>Upload PDFs</div>", unsafe_allow_html=True)
-        invoice_file = st.file_uploader(
-            'Invoice PDF (drag & drop)', type=['pdf'],
-            key=f"invoice_single_{st.session_state.upload_key_single}"
-        )
-        facture_file = st.file_uploader(
-            'Facture PDF (drag & drop)', type=['pdf'],
-            key=f"facture_single_{st.session_state.upload_key_single}"
-        )
-        st.markdown('</div>', unsafe_allow_html=True)
-
-    with col2:
-        st.markdown("<div class='app-card'><div class='section-title'>Actions</div>", unsafe_allow_html=True)
-        if st.button('Compare values', use_container_width=True):
-            if not invoice_file or not facture_file:
-                st.error('Upload both PDFs first.')
-            else:
-                invoice_path = save_uploaded_to_temp(invoice_file)
-                facture_path = save_uploaded_to_temp(facture_file)
-
-                progress = st.progress(0)
-                steps = [25, 50, 75, 100]
-
-                invoice_value1 = extract_value_from_pdf(invoice_path, invoice_k1); progress.progress(steps[0])
-                invoice_value2 = extract_value_from_pdf(invoice_path, invoice_k2); progress.progress(steps[1])
-                facture_value1 = extract_value_from_pdf(facture_path, facture_k1); progress.progress(steps[2])
-                facture_value2 = extract_value_from_pdf(facture_path, facture_k2); progress.progress(steps[3])
-
-                comparison_result = {
-                    'invoice_value1': invoice_value1,
-                    'invoice_value2': invoice_value2,
-                    'facture_value1': facture_value1,
-                    'facture_value2': facture_value2,
-                    'match': abs(invoice_value1 - facture_value1) <= 1.0 and abs(invoice_value2 - facture_value2) <= 1.0
-                }
-
-                if comparison_result['match']:
-                    st.success('✅ Values match')
+    st.sidebar.markdown("<div class='app-card'><div class='section-title'>Keywords</div>", unsafe_allow_html=True)
+    invoice_k1 = st.sidebar.text_input('Invoice keyword 1', value='Sub Total')
+    invoice_k2 = st.sidebar.text_input('Invoice keyword 2', value='VAT')
+    facture_k1 = st.sidebar.text_input('Facture keyword 1', value='Harga Jual / Penggantian / Uang Muka / Termin')
+    facture_k2 = st.sidebar.text_input('Facture keyword 2', value='Jumlah PPN (Pajak Pertambahan Nilai)')
+    st.sidebar.markdown("</div>", unsafe_allow_html=True)
+    keywords = {
+        'invoice_k1': invoice_k1, 'invoice_k2': invoice_k2,
+        'facture_k1': facture_k1, 'facture_k2': facture_k2
+    }
+
+    # -------------------------
+    # Single Comparison Page
+    # -------------------------
+
+    if page == "Single Comparison":
+        st.title("FusionPDF — Single Comparison")
+
+        # Initialize key counter for resetting uploaders
+        if "upload_key_single" not in st.session_state:
+            st.session_state["upload_key_single"] = 0
+
+        col1, col2 = st.columns(2)
+        comparison_result = None
+
+        with col1:
+            st.markdown("<div class='app-card'><div class='section-title'>Upload PDFs</div>", unsafe_allow_html=True)
+            invoice_file = st.file_uploader(
+                'Invoice PDF (drag & drop)', type=['pdf'],
+                key=f"invoice_single_{st.session_state.upload_key_single}"
+            )
+            facture_file = st.file_uploader(
+                'Facture PDF (drag & drop)', type=['pdf'],
+                key=f"facture_single_{st.session_state.upload_key_single}"
+            )
+            st.markdown('</div>', unsafe_allow_html=True)
+
+        with col2:
+            st.markdown("<div class='app-card'><div class='section-title'>Actions</div>", unsafe_allow_html=True)
+            # Keep the last comparison across reruns while the uploads and keywords are unchanged.
+            comparison_key = (
+                getattr(invoice_file, 'file_id', None),
+                getattr(facture_file, 'file_id', None),
+                tuple(keywords.values()),
+            )
+            stored = st.session_state.get('comparison_result')
+            if stored and stored[0] == comparison_key:
+                comparison_result = stored[1]
+
+            if st.button('Compare values', use_container_width=True):
+                if not invoice_file or not facture_file:
+                    st.error('Upload both PDFs first.')
                 else:
-                    st.warning('⚠️ Values do not match')
-
-                st.markdown(f"""
-                **Invoice**  
-                {comparison_result['invoice_value1']:.2f}  
-                {comparison_result['invoice_value2']:.2f}  
-
-                **Facture**  
-                {comparison_result['facture_value1']:.2f}  
-                {comparison_result['facture_value2']:.2f}
-                """)
-
-        if st.button('Preview PDFs', use_container_width=True):
-            if invoice_file:
-                st.image(preview_pdf_first_page_as_image(save_uploaded_to_temp(invoice_file)), caption='Invoice — First Page', use_container_width=True)
-            if facture_file:
-                st.image(preview_pdf_first_page_as_image(save_uploaded_to_temp(facture_file)), caption='Facture — First Page', use_container_width=True)
-
-        if st.button('Merge & Download', use_container_width=True, disabled=not (force_merge or comparison_result and comparison_result['match'])):
-            if not invoice_file or not facture_file:
-                st.error("Please upload both PDFs.")
+                    with st.spinner("Comparison In Progress..."):
+                        comparison_result = compare_pdf_values(invoice_file.getvalue(), facture_file.getvalue(), keywords)
+                    st.session_state['comparison_result'] = (comparison_key, comparison_result)
+
+                    if comparison_result['match']:
+                        st.success('✅ Values match')
+                    else:
+                        st.warning('⚠️ Values do not match')
+
+                    st.markdown(f"""
+                    **Invoice**  
+                    {comparison_result['invoice_value1']:.2f}  
+                    {comparison_result['invoice_value2']:.2f}  
+
+                    **Facture**  
+                    {comparison_result['facture_value1']:.2f}  
+                    {comparison_result['facture_value2']:.2f}
+                    """)
+
+            if st.button('Preview PDFs', use_container_width=True):
+                if invoice_file:
+                    st.image(cached_preview_png(invoice_file.getvalue()), caption='Invoice — First Page', use_container_width=True)
+                if facture_file:
+                    st.image(cached_preview_png(facture_file.getvalue()), caption='Facture — First Page', use_container_width=True)
+
+            if st.button('Merge & Download', use_container_width=True, disabled=not (force_merge or comparison_result and comparison_result['match'])):
+                if not invoice_file or not facture_file:
+                    st.error("Please upload both PDFs.")
+                else:
+                    merged_bytes = merge_pdfs_bytes(invoice_file.getvalue(), facture_file.getvalue())
+                    st.download_button('Download merged PDF', merged_bytes, file_name='merged.pdf', mime='application/pdf')
+
+            st.markdown("---")
+            if st.button("🔄 Reset Single Comparison"):
+                for key in ["invoice_path", "facture_path", "comparison_result"]:
+                    st.session_state.pop(key, None)
+                st.session_state["upload_key_single"] += 1
+                st.rerun()
+
+            st.markdown('</div>', unsafe_allow_html=True)
+
+    # -------------------------
+    # Bulk Comparison Page
+    # -------------------------
+
+    if page == "Bulk Comparison":
+        st.title("FusionPDF — Bulk Comparison")
+
+        if "upload_key_bulk" not in st.session_state:
+            st.session_state["upload_key_bulk"] = 0
+
+        col1, col2 = st.columns(2)
+        with col1:
+            invoice_files = st.file_uploader(
+                "Upload Invoice PDFs", type="pdf", accept_multiple_files=True,
+                key=f"bulk_invoice_{st.session_state.upload_key_bulk}"
+            )
+        with col2:
+            facture_files = st.file_uploader(
+                "Upload Facture PDFs", type="pdf", accept_multiple_files=True,
+                key=f"bulk_facture_{st.session_state.upload_key_bulk}"
+            )
+
+        if invoice_files:
+            st.write(f"Uploaded {len(invoice_files)} invoice file(s): {[f.name for f in invoice_files]}")
+        if facture_files:
+            st.write(f"Uploaded {len(facture_files)} facture file(s): {[f.name for f in facture_files]}")
+
+        if st.button("Run Bulk Comparison", use_container_width=True):
+            if not invoice_files or not facture_files:
+                st.error("Please upload both sets of PDFs.")
             else:
-                merged_bytes = merge_pdfs_bytes(save_uploaded_to_temp(invoice_file), save_uploaded_to_temp(facture_file))
-                st.download_button('Download merged PDF', merged_bytes, file_name='merged.pdf', mime='application/pdf')
+                # Index factures by file stem once; the first upload wins for duplicate stems.
+                factures_by_stem = {}
+                for fac in facture_files:
+                    factures_by_stem.setdefault(os.path.splitext(fac.name)[0], fac)
+
+                pairs = []
+                for f in invoice_files:
+                    matching_name = os.path.splitext(f.name)[0]
+                    facture_match = factures_by_stem.get(matching_name)
+                    if not facture_match:
+                        continue
+                    pairs.append((matching_name, f.getvalue(), facture_match.getvalue()))
+
+                discard_bulk_zip()
+                processed = [None] * len(pairs)
+                # Comparisons from earlier runs, keyed by content digests and keywords, so re-uploaded
+                # pairs are not extracted again. Pairs that need no merge skip the workers entirely.
+                comp_cache = st.session_state.setdefault('bulk_cache', {})
+                keyword_key = tuple(keywords.values())
+                cache_keys = [(pdf_digest(inv), pdf_digest(fac), keyword_key) for _, inv, fac in pairs]
+                pending = []
+                for i, (name, _, _) in enumerate(pairs):
+                    comp = comp_cache.get(cache_keys[i])
+                    if comp is not None and not (comp['match'] or force_merge):
+                        processed[i] = (name, comp)
+                    else:
+                        pending.append((i, comp))
+                bulk_zip, merged_count = None, 0
+                if pending:
+                    progress = st.progress(0, text="Comparison In Progress...")
+                    zip_fd, zip_path = tempfile.mkstemp(suffix='.zip')
+                    bulk_zip = BulkZip(zip_path)
+                    try:
+                        # Merged PDFs are already compressed, so store entries as-is, and write each one
+                        # to disk as it arrives instead of holding the whole batch in memory.
+                        with os.fdopen(zip_fd, 'wb') as zip_out, zipfile.ZipFile(zip_out, "w", zipfile.ZIP_STORED) as zip_file:
+                            results = iter_pair_results(pairs, pending, keywords, force_merge)
+                            for done, (i, (name, comp, merged_bytes)) in enumerate(results, start=1):
+                                processed[i] = (name, comp)
+                                if 'error' not in comp:
+                                    comp_cache[cache_keys[i]] = comp
+                                if merged_bytes is not None:
+                                    zip_file.writestr(f"{name}_merged.pdf", merged_bytes)
+                                    merged_count += 1
+                                progress.progress(done / len(pending), text=f"Compared {done} of {len(pending)} pairs")
+                    except BaseException:
+                        # Don't leave a partial ZIP of merged invoices behind in the temp dir.
+                        bulk_zip.discard()
+                        raise
+
+                comps = [comp for _, comp in processed]
+
+                st.success("✅ Bulk comparison complete!")
+                # Build the table column-wise so pandas sees one homogeneous list per column.
+                df = pd.DataFrame({
+                    "File": [name for name, _ in processed],
+                    "Invoice_1": [comp["invoice_value1"] for comp in comps],
+                    "Invoice_2": [comp["invoice_value2"] for comp in comps],
+                    "Facture_1": [comp["facture_value1"] for comp in comps],
+                    "Facture_2": [comp["facture_value2"] for comp in comps],
+                    "Status": [
+                        f"⛔ {comp['error']}" if 'error' in comp
+                        else "✅ Match" if comp['match'] else ("⚠️ Forced" if force_merge else "❌ Mismatch")
+                        for comp in comps
+                    ],
+                })
+                st.session_state['bulk_results'] = df
+                st.session_state['bulk_csv'] = df.to_csv(index=False).encode("utf-8")
+
+                if merged_count:
+                    st.session_state['bulk_zip'] = bulk_zip
+                elif bulk_zip:
+                    bulk_zip.discard()
+
+        if 'bulk_results' in st.session_state:
+            st.dataframe(st.session_state['bulk_results'], use_container_width=True)
+        if 'bulk_csv' in st.session_state:
+            st.download_button("Download Summary CSV", st.session_state['bulk_csv'], file_name="bulk_results.csv", mime="text/csv")
+        if 'bulk_zip' in st.session_state:
+            # Pass the reader itself so the archive is only loaded when the user downloads it,
+            # not on every rerun of this page.
+            st.download_button(
+                "Download All Merged PDFs (ZIP)", st.session_state['bulk_zip'].read,
+                file_name="merged_pdfs.zip", mime="application/zip"
+            )
 
         st.markdown("---")
-        if st.button("🔄 Reset Single Comparison"):
-            for key in ["invoice_path", "facture_path", "comparison_result"]:
+        if st.button("🔄 Reset Bulk Comparison"):
+            for key in ["bulk_csv", "bulk_results", "bulk_cache"]:
                 st.session_state.pop(key, None)
-            st.session_state["upload_key_single"] += 1
+            discard_bulk_zip()
+            st.session_state["upload_key_bulk"] += 1
             st.rerun()
 
-        st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown("<div class='small-muted'>FusionPDF — Natural Mocha v3.1. Supports single and bulk comparisons with full reset support.</div>", unsafe_allow_html=True)
 
-# -------------------------
-# Bulk Comparison Page
-# -------------------------
 
-if page == "Bulk Comparison":
-    st.title("FusionPDF — Bulk Comparison")
-
-    if "upload_key_bulk" not in st.session_state:
-        st.session_state["upload_key_bulk"] = 0
-
-    col1, col2 = st.columns(2)
-    with col1:
-        invoice_files = st.file_uploader(
-            "Upload Invoice PDFs", type="pdf", accept_multiple_files=True,
-            key=f"bulk_invoice_{st.session_state.upload_key_bulk}"
-        )
-    with col2:
-        facture_files = st.file_uploader(
-            "Upload Facture PDFs", type="pdf", accept_multiple_files=True,
-            key=f"bulk_facture_{st.session_state.upload_key_bulk}"
-        )
-
-    if invoice_files:
-        st.write(f"Uploaded {len(invoice_files)} invoice file(s): {[f.name for f in invoice_files]}")
-    if facture_files:
-        st.write(f"Uploaded {len(facture_files)} facture file(s): {[f.name for f in facture_files]}")
-
-    if st.button("Run Bulk Comparison", use_container_width=True):
-        if not invoice_files or not facture_files:
-            st.error("Please upload both sets of PDFs.")
-        else:
-            results, merged_outputs = [], []
-            with st.spinner("Comparison In Progress..."):
-                for f in invoice_files:
-                    invoice_path = save_uploaded_to_temp(f)
-                    matching_name = os.path.splitext(f.name)[0]
-                    facture_match = next(
-                        (fac for fac in facture_files if os.path.splitext(fac.name)[0] == matching_name),
-                        None
-                    )
-                    if not facture_match:
-                        continue
-                    facture_path = save_uploaded_to_temp(facture_match)
-                    comp = compare_pdf_values(invoice_path, facture_path, {
-                        'invoice_k1': invoice_k1, 'invoice_k2': invoice_k2,
-                        'facture_k1': facture_k1, 'facture_k2': facture_k2
-                    })
-                    status = "✅ Match" if comp['match'] else ("⚠️ Forced" if force_merge else "❌ Mismatch")
-                    results.append({
-                        "File": matching_name,
-                        "Invoice_1": comp["invoice_value1"],
-                        "Invoice_2": comp["invoice_value2"],
-                        "Facture_1": comp["facture_value1"],
-                        "Facture_2": comp["facture_value2"],
-                        "Status": status
-                    })
-                    if comp['match'] or force_merge:
-                        merged_bytes = merge_pdfs_bytes(invoice_path, facture_path)
-                        merged_outputs.append((matching_name, merged_bytes))
-
-            st.success("✅ Bulk comparison complete!")
-            df = pd.DataFrame(results)
-            st.session_state['bulk_results'] = df
-            st.session_state['bulk_csv'] = df.to_csv(index=False).encode("utf-8")
-
-            if merged_outputs:
-                zip_buffer = BytesIO()
-                with zipfile.ZipFile(zip_buffer, "w") as zip_file:
-                    for name, merged_bytes in merged_outputs:
-                        zip_file.writestr(f"{name}_merged.pdf", merged_bytes)
-                zip_buffer.seek(0)
-                st.session_state['bulk_zip'] = zip_buffer.read()
-
-    if 'bulk_results' in st.session_state:
-        st.dataframe(st.session_state['bulk_results'], use_container_width=True)
-    if 'bulk_csv' in st.session_state:
-        st.download_button("Download Summary CSV", st.session_state['bulk_csv'], file_name="bulk_results.csv", mime="text/csv")
-    if 'bulk_zip' in st.session_state:
-        st.download_button("Download All Merged PDFs (ZIP)", st.session_state['bulk_zip'], file_name="merged_pdfs.zip", mime="application/zip")
-
-    st.markdown("---")
-    if st.button("🔄 Reset Bulk Comparison"):
-        for key in ["bulk_csv", "bulk_zip", "bulk_results"]:
-            st.session_state.pop(key, None)
-        st.session_state["upload_key_bulk"] += 1
-        st.rerun()
-
-st.markdown("<div class='small-muted'>FusionPDF — Natural Mocha v3.1. Supports single and bulk comparisons with full reset support.</div>", unsafe_allow_html=True)
+# Streamlit runs this script as __main__. Bulk workers import it as __mp_main__ to unpickle
+# their tasks, and must not render the UI there.
+if __name__ == "__main__":
+    main()
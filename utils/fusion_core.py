@@ -0,0 +1,178 @@
+# utils/fusion_core.py — PDF extraction, comparison and merge helpers for FusionPDF
+
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+import pymupdf
+
+# -------------------------
+# Patterns
+# -------------------------
+
+_VAT_RE = re.compile(r"(?i)v[\s\.\-]*a[\s\.\-]*t[\s\.\-]*(?:[:\(\)%][\s:\-\(\)%]*)?([\d]+(?:[.,]\d{3})*(?:[.,]\d{2})?)")
+_SUBTOTAL_RE = re.compile(r"(?:Sub\s*Total|Subtotal)[^\d]{0,10}([\d]+(?:[.,]\d{3})*(?:[.,]\d{2})?)", re.IGNORECASE)
+_AMOUNT_TAIL_RE = re.compile(r"[\s:\-\(\)%]*([\d]+(?:[.,]\d{3})*(?:[.,]\d{2})?)")
+_DROP_SEPARATORS = str.maketrans('', '', '.,')
+
+# Extracted text keyed by blake2b digest of the PDF bytes; oldest entry is evicted first.
+# Streamlit runs each session's script in its own thread, so access goes through the lock.
+_TEXT_CACHE_SIZE = 256
+_TEXT_CACHE: dict = {}
+_TEXT_CACHE_LOCK = threading.Lock()
+
+# -------------------------
+# Core Functions
+# -------------------------
+
+def _parse_amount(raw: str) -> float:
+    """Parse a matched amount; a separator followed by exactly two digits is the decimal point."""
+    sep = max(raw.rfind('.'), raw.rfind(','))
+    if sep != -1 and len(raw) - sep == 3:
+        return float(raw[:sep].translate(_DROP_SEPARATORS) + '.' + raw[sep + 1:])
+    return float(raw.translate(_DROP_SEPARATORS))
+
+
+def pdf_digest(pdf_bytes: bytes) -> bytes:
+    """Short content digest used to key caches on PDF bytes."""
+    return hashlib.blake2b(pdf_bytes, digest_size=16).digest()
+
+
+def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+    """Extract whitespace-normalised text from a PDF, cached by content digest."""
+    digest = pdf_digest(pdf_bytes)
+    with _TEXT_CACHE_LOCK:
+        text = _TEXT_CACHE.get(digest)
+    if text is None:
+        # Extract outside the lock so other sessions are not blocked on this document.
+        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+            text = "\n".join(page.get_text("text") for page in doc)
+        # str.split() breaks on every Unicode space, U+00A0 and U+202F included.
+        text = " ".join(text.split())
+        with _TEXT_CACHE_LOCK:
+            if digest not in _TEXT_CACHE and len(_TEXT_CACHE) >= _TEXT_CACHE_SIZE:
+                _TEXT_CACHE.pop(next(iter(_TEXT_CACHE)), None)
+            _TEXT_CACHE[digest] = text
+    return text
+
+
+@lru_cache(maxsize=256)
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    return re.compile(rf"(?i){re.escape(keyword)}" + _AMOUNT_TAIL_RE.pattern)
+
+
+def _find_amount_after(text: str, keyword: str, haystack: str = None):
+    """Find the first case-insensitive occurrence of keyword that is followed by an amount.
+
+    haystack is text.lower(); callers scanning one text for several keywords pass it in.
+    """
+    if haystack is None:
+        haystack = text.lower()
+    needle = keyword.lower()
+    if len(haystack) != len(text):
+        # lower() changed some character widths, so offsets no longer line up with text.
+        return _keyword_pattern(keyword).search(text)
+    idx = haystack.find(needle)
+    while idx != -1:
+        match = _AMOUNT_TAIL_RE.match(text, idx + len(needle))
+        if match:
+            return match
+        idx = haystack.find(needle, idx + 1)
+    return None
+
+
+def extract_value_from_text(text: str, keyword: str, haystack: str = None) -> float:
+    """Extract a numeric value following a keyword in already-extracted text."""
+    if keyword.lower().strip() in ["vat", "v.a.t", "ppn"]:
+        match = _VAT_RE.search(text)
+    else:
+        match = _find_amount_after(text, keyword, haystack)
+    if match:
+        raw = match.group(1)
+    elif keyword.lower().strip() in ["vat", "v.a.t", "ppn"]:
+        sub = _SUBTOTAL_RE.search(text)
+        if sub:
+            subtotal = _parse_amount(sub.group(1))
+            return round(subtotal * 0.11, 2)
+        else:
+            return -1
+    else:
+        return -1
+    return _parse_amount(raw)
+
+
+def extract_values_from_pdf(pdf_bytes: bytes, keywords) -> list:
+    """Extract one numeric value per keyword, extracting the PDF text once."""
+    try:
+        text = extract_text_from_pdf(pdf_bytes)
+    except Exception:
+        return [-1] * len(keywords)
+    haystack = text.lower()
+    values = []
+    for keyword in keywords:
+        try:
+            values.append(extract_value_from_text(text, keyword, haystack))
+        except Exception:
+            values.append(-1)
+    return values
+
+
+def extract_value_from_pdf(pdf_bytes: bytes, keyword: str) -> float:
+    """Extract a numeric value from PDF based on a keyword."""
+    return extract_values_from_pdf(pdf_bytes, [keyword])[0]
+
+
+def _almost_equal(a: float, b: float, tol: float = 1.0) -> bool:
+    return a != -1 and b != -1 and abs(a - b) <= tol
+
+
+def compare_pdf_values(invoice_pdf: bytes, facture_pdf: bytes, keywords: dict) -> dict:
+    """Compare extracted values between invoice and facture."""
+    invoice_value1, invoice_value2 = extract_values_from_pdf(
+        invoice_pdf, [keywords.get('invoice_k1', ''), keywords.get('invoice_k2', '')]
+    )
+    facture_value1, facture_value2 = extract_values_from_pdf(
+        facture_pdf, [keywords.get('facture_k1', ''), keywords.get('facture_k2', '')]
+    )
+
+    match = _almost_equal(invoice_value1, facture_value1) and _almost_equal(invoice_value2, facture_value2)
+    return {
+        'invoice_value1': invoice_value1,
+        'invoice_value2': invoice_value2,
+        'facture_value1': facture_value1,
+        'facture_value2': facture_value2,
+        'match': match,
+    }
+
+
+def merge_pdfs_bytes(pdf1_bytes: bytes, pdf2_bytes: bytes) -> bytes:
+    """Merge two PDFs and return as bytes."""
+    with pymupdf.open() as merged:
+        for pdf_bytes in (pdf1_bytes, pdf2_bytes):
+            with pymupdf.open(stream=pdf_bytes, filetype="pdf") as src:
+                merged.insert_pdf(src)
+        return merged.tobytes()
+
+
+def preview_pdf_first_page_as_image(pdf_bytes: bytes, dpi: int = 100) -> bytes:
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pix = doc[0].get_pixmap(dpi=dpi, alpha=False)
+    return pix.tobytes("png")
+
+
+def process_pair(name: str, invoice_pdf: bytes, facture_pdf: bytes, keywords: dict, force_merge: bool, comp: dict = None):
+    """Compare one invoice/facture pair and merge it when it matches (or merging is forced).
+
+    A previously computed comparison can be passed as comp to skip re-extraction.
+    """
+    if comp is None:
+        comp = compare_pdf_values(invoice_pdf, facture_pdf, keywords)
+    merged_bytes = None
+    if comp['match'] or force_merge:
+        try:
+            merged_bytes = merge_pdfs_bytes(invoice_pdf, facture_pdf)
+        except Exception as e:
+            # Report the failure on this pair's row rather than aborting the whole batch.
+            comp = {**comp, 'error': f"Merge failed: {e}"}
+    return name, comp, merged_bytes